@@ -1,10 +1,15 @@
+import codecs
+import collections
 import datetime
-import io
+import gzip
+import json
 import os
 import sys
 import time
 import config
-from typing import List, Generator
+import planner
+import profile_report
+from typing import BinaryIO, Generator, List, NamedTuple, Optional, Tuple
 
 try:
     input = raw_input
@@ -15,6 +20,8 @@ import azure.storage.blob as azureblob
 import azure.batch.batch_service_client as batch
 import azure.batch.batch_auth as batchauth
 import azure.batch.models as batchmodels
+import requests
+from msrest.exceptions import ClientRequestError
 
 sys.path.append('.')
 sys.path.append('..')
@@ -150,7 +157,7 @@ def get_container_sas_url(
     """
     # Obtain the SAS token for the container.
     sas_token = get_container_sas_token(block_blob_client,
-                                        container_name, azureblob.BlobPermissions.WRITE)
+                                        container_name, blob_permissions)
 
     # Construct SAS URL for the container
     container_sas_url = "https://{}.blob.core.windows.net/{}?{}".format(
@@ -194,6 +201,7 @@ def create_pool(
         vm_size=config._POOL_VM_SIZE,
         target_dedicated_nodes=config._DEDICATED_POOL_NODE_COUNT,
         target_low_priority_nodes=config._LOW_PRIORITY_POOL_NODE_COUNT,
+        max_tasks_per_node=config._POOL_SLOTS_PER_NODE,
         start_task=batchmodels.StartTask(
             command_line="/bin/bash -c \"apt-get update && apt-get -y install python3.7 python3-pip\"",
             wait_for_success=True,
@@ -209,128 +217,422 @@ def create_pool(
 def create_job(
         batch_service_client: batch.BatchServiceClient,
         job_id: str,
-        pool_id: str) -> None:
+        pool_id: str,
+        priority: int = 0) -> None:
     """
     Creates a job with the specified ID, associated with the specified pool.
 
     :param batch_service_client: A Batch service client.
     :param job_id: The ID for the job.
     :param pool_id: The ID for the pool.
+    :param priority: The priority of the job from -1000 to 1000, tasks of
+     higher priority jobs are scheduled first on a shared pool.
     """
     print('Creating job [{}]...'.format(job_id))
 
     job = batch.models.JobAddParameter(
         id=job_id,
-        pool_info=batch.models.PoolInformation(pool_id=pool_id))
+        pool_info=batch.models.PoolInformation(pool_id=pool_id),
+        priority=priority)
 
     batch_service_client.job.add(job)
 
 
-def add_tasks(
-        batch_service_client: batch.BatchServiceClient,
-        job_id: str,
+def _make_tasks(
         source_files: List[batchmodels.ResourceFile],
         input_files: List[batchmodels.ResourceFile],
-        output_container_sas_url: str) -> None:
+        output_container_sas_url: str,
+        checkpoint_container_sas_url: str = None,
+        feature_store_sas_url: str = None,
+        profile: bool = False) -> List[batchmodels.TaskAddParameter]:
     """
-    Adds a task for each input file in the collection to the specified job.
+    Creates a task for each input file in the collection.
 
-    :param batch_service_client: A Batch service client.
-    :param job_id: The ID of the job to which to add the tasks.
     :param source_files: A collection of source files.
     :param input_files: A collection of input files. One task will be created
      for each input file.
     :param output_container_sas_url: A SAS URL granting the specified
      permissions to the output container.
+    :param checkpoint_container_sas_url: A SAS URL granting read and write
+     permissions to the container where tasks save checkpoints, default None
+     disables checkpointing.
+    :param feature_store_sas_url: A SAS URL granting read and write
+     permissions to the feature store container, default None keeps
+     precomputed features on the node only.
+    :param profile: Whether to profile the tasks and upload the profiles.
+    :return: The tasks to add to a job.
     """
-
-    print('Adding {} tasks to job [{}]...'.format(len(input_files), job_id))
+    environment_settings = []
+    if checkpoint_container_sas_url:
+        environment_settings.append(batchmodels.EnvironmentSetting(
+            name=config._CHECKPOINT_URL_ENV,
+            value=checkpoint_container_sas_url))
+    if feature_store_sas_url:
+        environment_settings.append(batchmodels.EnvironmentSetting(
+            name=config._FEATURE_STORE_URL_ENV,
+            value=feature_store_sas_url))
 
     tasks = list()
     for idx, input_file in enumerate(input_files):
         input_file_path = input_file.file_path
-        output_file_path = "".join(
-            (os.path.basename(input_file_path)).split('.')[:-1]) + 'output.txt'
+        input_name = "".join(
+            (os.path.basename(input_file_path)).split('.')[:-1])
+        output_file_path = input_name + 'output.txt'
+        entry = f"python3.7 {config._TASK_ENTRY_SCRIPT} {input_file_path} {output_file_path}"
+        output_files = [batchmodels.OutputFile(
+            file_pattern=output_file_path,
+            destination=batchmodels.OutputFileDestination(
+                container=batchmodels.OutputFileBlobContainerDestination(
+                      container_url=output_container_sas_url,
+                      path=f"{config._RESULT_BLOB_PREFIX}/{output_file_path}")),
+            upload_options=batchmodels.OutputFileUploadOptions(
+                upload_condition=batchmodels.OutputFileUploadCondition.task_success))]
+        setup = ""
+        if profile:
+            profile_prefix = input_name + 'profile'
+            entry += f" --profile {profile_prefix}"
+            if config._PROFILE_SAMPLING:
+                setup = "python3.7 -m pip install py-spy && "\
+                    "export PATH=$PATH:$(python3.7 -m site --user-base)/bin && "
+                entry = f"py-spy record --format raw "\
+                    f"-o {profile_prefix}.sampled.folded -- {entry}"
+            # Upload profiles of failed tasks as well, they are often the slow ones
+            output_files.append(batchmodels.OutputFile(
+                file_pattern=f"{profile_prefix}.*",
+                destination=batchmodels.OutputFileDestination(
+                    container=batchmodels.OutputFileBlobContainerDestination(
+                          container_url=output_container_sas_url,
+                          path=config._PROFILE_BLOB_PREFIX)),
+                upload_options=batchmodels.OutputFileUploadOptions(
+                    upload_condition=batchmodels.OutputFileUploadCondition.task_completion)))
         command = "/bin/bash -c \""\
             "python3.7 -m pip install --upgrade pip && "\
             "python3.7 -m pip install wheel && "\
             f"python3.7 -m pip install -r {config._JOB_SCRIPT_PATH}/requirements.txt && "\
-            f"python3.7 {config._TASK_ENTRY_SCRIPT} {input_file_path} {output_file_path}"\
+            f"{setup}{entry}"\
             "\""
         tasks.append(
             batch.models.TaskAddParameter(
                 id='Task{}'.format(idx),
                 command_line=command,
                 resource_files=source_files+[input_file],
-                output_files=[batchmodels.OutputFile(
-                    file_pattern=output_file_path,
-                    destination=batchmodels.OutputFileDestination(
-                        container=batchmodels.OutputFileBlobContainerDestination(
-                              container_url=output_container_sas_url)),
-                    upload_options=batchmodels.OutputFileUploadOptions(
-                        upload_condition=batchmodels.OutputFileUploadCondition.task_success))]
+                environment_settings=environment_settings,
+                constraints=batchmodels.TaskConstraints(
+                    max_task_retry_count=config._TASK_MAX_RETRY_COUNT),
+                output_files=output_files
             )
         )
-    batch_service_client.task.add_collection(job_id, tasks)
+    return tasks
 
 
-def wait_for_tasks_to_complete(
+def add_reduce_task(
         batch_service_client: batch.BatchServiceClient,
         job_id: str,
-        timeout: datetime.timedelta) -> None:
+        source_files: List[batchmodels.ResourceFile],
+        output_container_sas_url: str) -> None:
+    """
+    Adds the task that merges the results of all tasks into one summary blob.
+
+    The task runs inside the cluster, so the per-task results are read over
+    the datacenter network and the client only downloads the summary.
+
+    :param batch_service_client: A Batch service client.
+    :param job_id: The ID of the job to which to add the task.
+    :param source_files: A collection of source files.
+    :param output_container_sas_url: A SAS URL granting read, list and write
+     permissions to the output container.
+    """
+    print('Adding task [{}] to job [{}]...'.format(config._REDUCE_TASK_ID,
+                                                   job_id))
+
+    # The reduce script only uses the standard library, no pip install needed
+    command = "/bin/bash -c \""\
+        f"cd {config._JOB_SCRIPT_PATH} && "\
+        f"python3.7 {config._REDUCE_SCRIPT.name} "\
+        f"{config._RESULT_BLOB_PREFIX}/ {config._SUMMARY_BLOB_NAME}"\
+        "\""
+    task = batch.models.TaskAddParameter(
+        id=config._REDUCE_TASK_ID,
+        command_line=command,
+        resource_files=source_files,
+        environment_settings=[batchmodels.EnvironmentSetting(
+            name=config._OUTPUT_URL_ENV,
+            value=output_container_sas_url)],
+        constraints=batchmodels.TaskConstraints(
+            max_task_retry_count=config._TASK_MAX_RETRY_COUNT))
+    batch_service_client.task.add(job_id, task)
+
+
+def _poll_tasks(
+        batch_service_client: batch.BatchServiceClient,
+        job_id: str,
+        requeues: collections.Counter,
+        preemptions: collections.Counter,
+        requeue_limit: int) -> Tuple[List[batchmodels.CloudTask],
+                                     List[batchmodels.CloudTask]]:
+    """Checks the tasks of a job once and reactivates failed tasks.
+
+    :param batch_service_client: A Batch service client.
+    :param job_id: The id of the job whose tasks should be checked.
+    :param requeues: Reactivations per task id, updated in place.
+    :param preemptions: Requeues by the Batch service per task id, updated in
+     place.
+    :param requeue_limit: How many times a failed task is reactivated.
+    :return: The incomplete tasks and the tasks that failed for good.
+    """
+    incomplete_tasks = []
+    failed_tasks = []
+    for task in batch_service_client.task.list(job_id):
+        info = task.execution_info
+        if info and info.requeue_count > preemptions[task.id]:
+            preemptions[task.id] = info.requeue_count
+            print(f"\nTask {task.id} was preempted and requeued.", end='')
+        if task.state != batchmodels.TaskState.completed:
+            incomplete_tasks.append(task)
+        elif info.result == batchmodels.TaskExecutionResult.failure:
+            if requeues[task.id] < requeue_limit:
+                requeues[task.id] += 1
+                print(f"\nTask {task.id} failed, requeue "
+                      f"{requeues[task.id]}/{requeue_limit}.", end='')
+                batch_service_client.task.reactivate(job_id, task.id)
+                incomplete_tasks.append(task)
+            else:
+                failed_tasks.append(task)
+    return incomplete_tasks, failed_tasks
+
+
+def _print_failed_tasks(failed_tasks: List[batchmodels.CloudTask]) -> None:
+    for task in failed_tasks:
+        print(f"Task {task.id} failed: "
+              f"{task.execution_info.failure_info.message}")
+
+
+class TaskFileTail:
+    """Follows a file of a running task, like tail -f.
+
+    Each poll reads only the bytes appended since the previous poll with a
+    range request. When the task is retried or requeued, the new attempt is
+    followed from its start.
+    """
+
+    def __init__(
+            self,
+            job_id: str,
+            task_id: str,
+            file_name: str = config._STANDARD_OUT_FILE_NAME,
+            encoding: str = None) -> None:
+        self.job_id = job_id
+        self.task_id = task_id
+        self.file_name = file_name
+        self.encoding = encoding or 'utf-8'
+        self.attempt = None
+        self._restart()
+
+    def _restart(self) -> None:
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder(self.encoding)(
+            errors='replace')
+
+    def poll(self, batch_service_client: batch.BatchServiceClient) -> None:
+        """Prints the bytes appended to the file since the last poll.
+
+        :param batch_service_client: A Batch service client.
+        """
+        try:
+            info = batch_service_client.task.get(
+                self.job_id, self.task_id).execution_info
+            attempt = (info.retry_count, info.requeue_count) if info else None
+            properties = batch_service_client.file.get_properties_from_task(
+                self.job_id, self.task_id, self.file_name, raw=True)
+            size = int(properties.headers['Content-Length'])
+            # A new attempt writes a new file, a shorter file also means one
+            if attempt != self.attempt or size < self.offset:
+                if self.offset:
+                    print("\nTask {} restarted.".format(self.task_id), end='')
+                self.attempt = attempt
+                self._restart()
+            if size <= self.offset:
+                return
+            if self.offset == 0:
+                print("\nTask {} output:".format(self.task_id))
+            stream = batch_service_client.file.get_from_task(
+                self.job_id, self.task_id, self.file_name,
+                file_get_from_task_options=batchmodels.FileGetFromTaskOptions(
+                    ocp_range='bytes={}-{}'.format(self.offset, size - 1)))
+            for data in stream:
+                self.offset += len(data)
+                sys.stdout.write(self.decoder.decode(data))
+        except (batchmodels.BatchErrorException, ClientRequestError,
+                requests.RequestException):
+            # The task has not started yet, its node is gone or the download
+            # broke off, the next poll resumes from the offset reached
+            pass
+        sys.stdout.flush()
+
+
+class Experiment(NamedTuple):
+    """An experiment, run as one job on the shared pool."""
+    name: str
+    input_path: str  # Folder of the input files, one task per file
+    priority: int = 0  # Job priority from -1000 to 1000
+    max_running_tasks: int = 0  # Tasks of the job running at once, 0 no limit
+    profile: bool = False  # Profile the tasks and merge the profiles
+
+
+class ExperimentRun:
+    """The state of an experiment while its job runs."""
+
+    def __init__(
+            self,
+            experiment: Experiment,
+            job_id: str,
+            output_container_name: str,
+            output_container_reduce_sas_url: str,
+            tasks: List[batchmodels.TaskAddParameter]) -> None:
+        self.experiment = experiment
+        self.job_id = job_id
+        self.output_container_name = output_container_name
+        self.output_container_reduce_sas_url = output_container_reduce_sas_url
+        self.pending_tasks = tasks
+        self.requeues = collections.Counter()
+        self.preemptions = collections.Counter()
+        self.failed_tasks = []
+        self.reduce_added = False
+        self.done = False
+
+    def node_count(self) -> int:
+        """Nodes needed to run as many tasks at once as allowed."""
+        limit = self.experiment.max_running_tasks or len(self.pending_tasks)
+        return min(limit, len(self.pending_tasks))
+
+
+def run_experiments(
+        batch_service_client: batch.BatchServiceClient,
+        pool_id: str,
+        runs: List[ExperimentRun],
+        source_files: List[batchmodels.ResourceFile],
+        timeout: datetime.timedelta,
+        requeue_limit: int = config._TASK_REQUEUE_LIMIT,
+        tails: List[TaskFileTail] = ()) -> bool:
     """
-    Returns when all tasks in the specified job reach the Completed state.
+    Runs the experiments as concurrent jobs on one pool.
+
+    A single monitor loop submits the tasks of each job without exceeding its
+    max running tasks, reactivates failed tasks and adds the reduce task of a
+    job once all of its tasks are final. Returns when all jobs are done.
 
     :param batch_service_client: A Batch service client.
-    :param job_id: The id of the job whose tasks should be monitored.
-    :param timeout: The duration to wait for task completion. If all
-     tasks in the specified job do not reach Completed state within this time
-     period, an exception will be raised.
+    :param pool_id: The ID of the shared pool.
+    :param runs: The experiments to run.
+    :param source_files: A collection of source files.
+    :param timeout: The duration to wait for all jobs. If they are not done
+     within this time period, an exception will be raised.
+    :param requeue_limit: How many times a failed task is reactivated.
+    :param tails: Files of tasks to print live while they run.
+    :return: True if all tasks succeeded, False if some tasks failed.
     """
+    for run in runs:
+        create_job(batch_service_client, run.job_id, pool_id,
+                   run.experiment.priority)
+
     timeout_expiration = datetime.datetime.now() + timeout
 
-    print("Monitoring all tasks for 'Completed' state, timeout in {}..."
-          .format(timeout), end='')
+    print("Monitoring {} jobs for completion, timeout in {}..."
+          .format(len(runs), timeout), end='')
 
     while datetime.datetime.now() < timeout_expiration:
         print('.', end='')
         sys.stdout.flush()
-        tasks = batch_service_client.task.list(job_id)
-
-        incomplete_tasks = [task for task in tasks if
-                            task.state != batchmodels.TaskState.completed]
-        if not incomplete_tasks:
+        for run in runs:
+            if run.done:
+                continue
+            incomplete_tasks, run.failed_tasks = _poll_tasks(
+                batch_service_client, run.job_id, run.requeues,
+                run.preemptions, requeue_limit)
+            if run.pending_tasks:
+                _submit_pending_tasks(batch_service_client, run,
+                                      len(incomplete_tasks))
+            elif not incomplete_tasks:
+                if run.reduce_added:
+                    run.done = True
+                else:
+                    # Merge the task results on the cluster once all of them
+                    # are final. Added only now rather than as a dependent
+                    # task, so results of reactivated tasks are not missed.
+                    # The job keeps its requeue counters, so tasks that used
+                    # up their budget are not reactivated while it runs.
+                    print()
+                    add_reduce_task(batch_service_client, run.job_id,
+                                    source_files,
+                                    run.output_container_reduce_sas_url)
+                    run.reduce_added = True
+        for tail in tails:
+            tail.poll(batch_service_client)
+        if all(run.done for run in runs):
             print()
-            return True
-        else:
-            time.sleep(1)
+            for run in runs:
+                _print_failed_tasks(run.failed_tasks)
+            return not any(run.failed_tasks for run in runs)
+        time.sleep(1)
 
     print()
-    raise RuntimeError("ERROR: Tasks did not reach 'Completed' state within "
+    raise RuntimeError("ERROR: Jobs did not complete within "
                        "timeout period of " + str(timeout))
 
 
+def _submit_pending_tasks(
+        batch_service_client: batch.BatchServiceClient,
+        run: ExperimentRun,
+        running: int) -> None:
+    """Adds pending tasks to the job of run, up to its max running tasks.
+
+    :param batch_service_client: A Batch service client.
+    :param run: The experiment with pending tasks.
+    :param running: The number of incomplete tasks of the job.
+    """
+    limit = run.experiment.max_running_tasks
+    count = max(0, limit - running) if limit else len(run.pending_tasks)
+    count = min(count, config._TASK_COLLECTION_LIMIT)
+    if not count:
+        return
+    tasks = run.pending_tasks[:count]
+    result = batch_service_client.task.add_collection(run.job_id, tasks)
+    retry = set()
+    for task_result in result.value:
+        if task_result.status == batchmodels.TaskAddStatus.server_error:
+            # Transient, e.g. server busy, submit it again on the next poll
+            retry.add(task_result.task_id)
+        # TaskExists: a resubmitted task was added despite its server error
+        elif task_result.status == batchmodels.TaskAddStatus.client_error and \
+                task_result.error.code != 'TaskExists':
+            raise RuntimeError("ERROR: Task {} of job [{}] was rejected: {}".format(
+                task_result.task_id, run.job_id,
+                task_result.error.message.value))
+    run.pending_tasks = [task for task in tasks if task.id in retry] + \
+        run.pending_tasks[count:]
+
+
 def print_task_output(
         batch_service_client: batch.BatchServiceClient,
         job_id: str,
-        blob_client: azureblob.BlockBlobService,
-        output_container_name: str,
-        encoding: str = None) -> None:
-    """Prints the stdout, stderr and output files for each task in the job.
+        encoding: str = None,
+        log_path: str = None) -> None:
+    """Prints the stdout and stderr for each task in the job.
+
+    The files are streamed chunk by chunk, so memory use does not depend on
+    their size.
 
     :param batch_service_client: The batch client to use.
     :param job_id: The id of the job with task output files to print.
-    :param blob_client: A blob service client.
-    :param output_container_name: The name for output container
     :param encoding: The encoding of the file. The default is utf-8.
+    :param log_path: If set, the files are saved below this folder instead of
+     printed, as {log_path}/{task id}/{file name}.
     """
 
     print('Printing task output...')
 
     tasks = batch_service_client.task.list(job_id)
 
-    models = []
-
     for task in tasks:
 
         node_id = batch_service_client.task.get(
@@ -338,82 +640,115 @@ def print_task_output(
         print("Task: {}".format(task.id))
         print("Node: {}".format(node_id))
 
-        stream = batch_service_client.file.get_from_task(
-            job_id, task.id, config._STANDARD_OUT_FILE_NAME)
-
-        file_text = _read_stream_as_string(
-            stream,
-            encoding)
-        print("Standard output:")
-        print(file_text)
-
-        stream = batch_service_client.file.get_from_task(
-            job_id, task.id, config._ERROR_OUT_FILE_NAME)
-
-        file_text = _read_stream_as_string(
-            stream,
-            encoding)
-        print("Error output:")
-        print(file_text)
-
-        for outputfile in task.output_files:
-            output = io.BytesIO()
-            blob_client.get_blob_to_stream(
-                output_container_name, outputfile.file_pattern, output)
-            file_content = output.getvalue().decode('utf-8')
-            print(f"Output file {outputfile.file_pattern}:")
-            print(file_content)
-            name, score, *_ = file_content.splitlines()
-            score = float(score.split(": ")[1])
-            models.append((score, name))
+        for title, file_name in (
+                ("Standard output", config._STANDARD_OUT_FILE_NAME),
+                ("Error output", config._ERROR_OUT_FILE_NAME)):
+            stream = batch_service_client.file.get_from_task(
+                job_id, task.id, file_name)
+            if log_path:
+                file_path = os.path.join(log_path, task.id, file_name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'wb') as fd:
+                    _copy_stream(stream, fd)
+                print("{} saved to {}".format(title, file_path))
+            else:
+                print("{}:".format(title))
+                _print_stream(stream, encoding)
+                print()
+
+
+def print_experiment_summary(
+        blob_client: azureblob.BlockBlobService,
+        output_container_name: str) -> Optional[dict]:
+    """Prints the model ranking from the summary written by the reduce task.
+
+    :param blob_client: A blob service client.
+    :param output_container_name: The name for output container
+    :return: The summary, or None if the reduce task did not write one.
+    """
+    if not blob_client.exists(output_container_name, config._SUMMARY_BLOB_NAME):
+        print("\n\nNo summary, the reduce task failed. See its error output.")
+        return None
+
+    blob = blob_client.get_blob_to_bytes(
+        output_container_name, config._SUMMARY_BLOB_NAME)
+    summary = json.loads(gzip.decompress(blob.content).decode('utf-8'))
+
     print("\n\nEvaluation and comparision of all the models:")
     print(f"{'Model':<25}R-squared Score")
-    for m in sorted(models, reverse=True):
-        print(f"{m[1]:<25}{m[0]}")
+    for m in summary['models']:
+        print(f"{m['name']:<25}{m['score']}")
+    return summary
 
 
-def _read_stream_as_string(stream: Generator, encoding: str) -> str:
-    """Read stream as string
+def _copy_stream(stream: Generator, fd: BinaryIO) -> None:
+    """Writes a stream to a file chunk by chunk.
+
+    :param stream: input stream generator
+    :param fd: The file opened in binary mode.
+    """
+    for data in stream:
+        fd.write(data)
+
+
+def _print_stream(stream: Generator, encoding: str) -> None:
+    """Prints a stream chunk by chunk.
 
     :param stream: input stream generator
     :param encoding: The encoding of the file. The default is utf-8.
-    :return: The file content.
     """
-    output = io.BytesIO()
-    try:
-        for data in stream:
-            output.write(data)
-        if encoding is None:
-            encoding = 'utf-8'
-        return output.getvalue().decode(encoding)
-    finally:
-        output.close()
-    raise RuntimeError('could not write data to stream or decode bytes')
+    # Characters may be split between chunks, decode incrementally
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(
+        errors='replace')
+    for data in stream:
+        sys.stdout.write(decoder.decode(data))
+    sys.stdout.write(decoder.decode(b'', final=True))
+    sys.stdout.flush()
 
 
 def _upload_input_files(
         blob_client: azureblob.BlockBlobService,
-        container_name: str) -> List[batchmodels.ResourceFile]:
+        container_name: str,
+        input_path: str = config._JOB_INPUT_PATH) -> List[batchmodels.ResourceFile]:
     """Upload input files to Azure Storage Account
 
     :param blob_client: A blob service client.
     :param container_name: The name of the Azure Blob storage container.
+    :param input_path: The folder of the input files.
     :return: A collection of input files.
     """
-    # Create a list of all job defination files in the inputFiles directory.
+    # Upload the input files. This is the collection of files that are to be processed by the tasks.
+    return [
+        upload_file_to_container(
+            blob_client, container_name, file_path, input_path)
+        for file_path in _input_file_paths(input_path)]
+
+
+def _input_file_paths(input_path: str) -> List[str]:
+    """List the job definition files of an experiment
+
+    :param input_path: The folder of the input files.
+    :return: The local paths of the input files.
+    """
+    # Create a list of all job defination files in the input directory.
     input_file_paths = []
 
-    for folder, _, files in os.walk(os.path.join(sys.path[0], config._JOB_INPUT_PATH)):
+    for folder, _, files in os.walk(os.path.join(sys.path[0], input_path)):
         for filename in files:
             if filename.endswith(".txt"):
                 input_file_paths.append(os.path.abspath(
                     os.path.join(folder, filename)))
+    return input_file_paths
 
-    # Upload the input files. This is the collection of files that are to be processed by the tasks.
-    return [
-        upload_file_to_container(
-            blob_client, container_name, file_path, config._JOB_INPUT_PATH)
-        for file_path in input_file_paths]
+
+def _read_input_model(file_path: str) -> str:
+    """Read the model an input file selects, as the task entry script does
+
+    :param file_path: The local path of the input file.
+    :return: The model name.
+    """
+    with open(file_path) as f:
+        return f.readline().strip().lower()
 
 
 def _upload_source_files(
@@ -461,13 +796,9 @@ if __name__ == '__main__':
     blob_client.create_container(input_container_name, fail_on_exist=False)
     print('Container [{}] created.'.format(input_container_name))
 
-    output_container_name = f'output-{int(start_time.timestamp())}'
-    blob_client.create_container(output_container_name, fail_on_exist=False)
-    print('Container [{}] created.'.format(output_container_name))
-
-    input_files = _upload_input_files(blob_client, input_container_name)
-    config._LOW_PRIORITY_POOL_NODE_COUNT = len(
-        input_files)  # Change pool size from num of input
+    checkpoint_container_name = f'checkpoint-{int(start_time.timestamp())}'
+    blob_client.create_container(checkpoint_container_name, fail_on_exist=False)
+    print('Container [{}] created.'.format(checkpoint_container_name))
 
     source_files = _upload_source_files(blob_client, input_container_name)
     if not any(
@@ -475,12 +806,91 @@ if __name__ == '__main__':
     ):
         raise RuntimeError("ERROR: Did not find job entry source code file")
 
-    # Obtain a shared access signature URL that provides write access to the output
-    # container to which the tasks will upload their output.
-    output_container_sas_url = get_container_sas_url(
+    # Tasks read and write their checkpoints, so a task requeued after
+    # preemption resumes where the previous attempt stopped.
+    checkpoint_container_sas_url = get_container_sas_url(
+        blob_client,
+        checkpoint_container_name,
+        azureblob.BlobPermissions.READ + azureblob.BlobPermissions.WRITE)
+
+    # Preprocessed features are computed once and shared by all tasks, this
+    # container is kept so later runs reuse them.
+    blob_client.create_container(config._FEATURE_STORE_CONTAINER,
+                                 fail_on_exist=False)
+    feature_store_sas_url = get_container_sas_url(
         blob_client,
-        output_container_name,
-        azureblob.BlobPermissions.WRITE)
+        config._FEATURE_STORE_CONTAINER,
+        azureblob.BlobPermissions.READ + azureblob.BlobPermissions.WRITE)
+
+    # Every experiment runs as its own job with its own output container.
+    runs = []
+    for idx, experiment in enumerate(Experiment(*e) for e in config._EXPERIMENTS):
+        output_container_name = f'output-{int(start_time.timestamp())}-{idx}'
+        blob_client.create_container(output_container_name, fail_on_exist=False)
+        print('Container [{}] created.'.format(output_container_name))
+
+        input_files = _upload_input_files(blob_client, input_container_name,
+                                          experiment.input_path)
+
+        # Obtain a shared access signature URL that provides write access to the output
+        # container to which the tasks will upload their output.
+        output_container_sas_url = get_container_sas_url(
+            blob_client,
+            output_container_name,
+            azureblob.BlobPermissions.WRITE)
+
+        # The reduce task lists and reads the task results and writes the summary.
+        output_container_reduce_sas_url = get_container_sas_url(
+            blob_client,
+            output_container_name,
+            azureblob.BlobPermissions.READ + azureblob.BlobPermissions.LIST +
+            azureblob.BlobPermissions.WRITE)
+
+        runs.append(ExperimentRun(
+            experiment,
+            f"{config._JOB_ID}_{int(start_time.timestamp())}_{experiment.name}",
+            output_container_name,
+            output_container_reduce_sas_url,
+            _make_tasks(source_files, input_files, output_container_sas_url,
+                        checkpoint_container_sas_url, feature_store_sas_url,
+                        experiment.profile)))
+
+    # Change pool size to run all experiments at their max concurrency
+    config._LOW_PRIORITY_POOL_NODE_COUNT = sum(run.node_count() for run in runs)
+
+    # Monitor the jobs until the deadline, or the planned makespan if planned
+    timeout_seconds = config._PLAN_DEADLINE_MINUTES * 60
+    if config._PLAN_POOL:
+        # Pick VM size, node count and slots from the runtimes of past runs.
+        # Tasks of higher priority jobs start first, the others in the order
+        # they are submitted.
+        experiments = sorted((Experiment(*e) for e in config._EXPERIMENTS),
+                             key=lambda e: -e.priority)
+        models = [_read_input_model(file_path)
+                  for experiment in experiments
+                  for file_path in _input_file_paths(experiment.input_path)]
+        try:
+            plan = planner.plan_pool(models,
+                                     config._LOW_PRIORITY_POOL_NODE_COUNT,
+                                     config._PLAN_DEADLINE_MINUTES * 60)
+        except RuntimeError as err:
+            print(err)
+            print('Using the default pool.')
+        else:
+            if plan is None:
+                print('No run history for all models, using the default pool.')
+            else:
+                print('Planned pool: {} x {} with {} slots, predicted makespan '
+                      '{} and {:.2f} node-hours.'.format(
+                          plan.node_count, plan.vm_size, plan.slots_per_node,
+                          datetime.timedelta(seconds=int(plan.makespan_seconds)),
+                          plan.node_hours))
+                config._POOL_VM_SIZE = plan.vm_size
+                config._LOW_PRIORITY_POOL_NODE_COUNT = plan.node_count
+                config._POOL_SLOTS_PER_NODE = plan.slots_per_node
+                timeout_seconds = plan.makespan_seconds
+    timeout = datetime.timedelta(
+        seconds=int(timeout_seconds * config._MONITOR_TIMEOUT_MARGIN))
 
     # Create a Batch service client. We'll now be interacting with the Batch
     # service in addition to Storage
@@ -492,30 +902,52 @@ if __name__ == '__main__':
         batch_url=config._BATCH_ACCOUNT_URL)
 
     batch_pool_id = f"{config._POOL_ID}_{int(start_time.timestamp())}"
-    job_id = f"{config._JOB_ID}_{int(start_time.timestamp())}"
     try:
         # Create the pool that will contain the compute nodes that will execute the tasks.
         create_pool(batch_client, batch_pool_id)
 
-        # Create the job that will run the tasks.
-        create_job(batch_client, job_id, batch_pool_id)
-
-        # Add the tasks to the job. Pass the input files and a SAS URL
-        # to the storage container for output files.
-        add_tasks(batch_client, job_id, source_files,
-                  input_files, output_container_sas_url)
+        # Create a job per experiment and pause execution until all are done.
+        # Follow the output of the chosen tasks while the jobs run
+        tails = [TaskFileTail(run.job_id, task_id)
+                 for run in runs
+                 for name, task_id in config._TAIL_TASKS
+                 if name == run.experiment.name]
 
-        # Pause execution until tasks reach Completed state.
-        wait_for_tasks_to_complete(batch_client,
-                                   job_id,
-                                   datetime.timedelta(minutes=30))
-
-        print("  Success! All tasks reached the 'Completed' state within the "
-              "specified timeout period.")
-
-        # Print the stdout, stderr, and output files for each task to the console
-        print_task_output(batch_client, job_id, blob_client,
-                          output_container_name)
+        try:
+            succeeded = run_experiments(batch_client, batch_pool_id, runs,
+                                        source_files, timeout, tails=tails)
+        except RuntimeError as err:
+            # Carry on to the cleanup, the pool keeps running otherwise
+            print(err)
+            succeeded = None
+        if succeeded:
+            print("  Success! All tasks reached the 'Completed' state within "
+                  "the specified timeout period.")
+        elif succeeded is False:
+            print("  Some tasks failed after all retries and requeues.")
+
+        for run in runs:
+            print()
+            print('Experiment [{}]:'.format(run.experiment.name))
+            if run.failed_tasks:
+                # Save the stdout and stderr for each task to disk
+                print_task_output(batch_client, run.job_id,
+                                  log_path=os.path.join(config._TASK_LOG_PATH,
+                                                        run.job_id))
+
+            summary = print_experiment_summary(blob_client,
+                                               run.output_container_name)
+            # cProfile and tracemalloc inflate runtime and memory, keep
+            # profiled runs out of the planner history
+            if summary and not run.experiment.profile:
+                planner.record_history(summary, config._POOL_VM_SIZE,
+                                       config._POOL_SLOTS_PER_NODE)
+
+            if run.experiment.profile:
+                profile_report.write_profile_report(
+                    blob_client, run.output_container_name,
+                    os.path.join(config._PROFILE_REPORT_PATH,
+                                 run.experiment.name))
 
     except batchmodels.BatchErrorException as err:
         print_batch_exception(err)
@@ -534,16 +966,23 @@ if __name__ == '__main__':
         blob_client.delete_container(input_container_name)
 
     # Clean up Batch resources (if the user so chooses).
-    if query_yes_no('Delete job?') == 'yes':
-        batch_client.job.delete(job_id)
+    if query_yes_no('Delete jobs?') == 'yes':
+        for run in runs:
+            batch_client.job.delete(run.job_id)
 
     if query_yes_no('Delete pool?') == 'yes':
         batch_client.pool.delete(batch_pool_id)
 
-    # Delete output container in storage
-    if query_yes_no('Delete output container?') == 'yes':
-        print('Deleting container [{}]...'.format(output_container_name))
-        blob_client.delete_container(output_container_name)
+    # Delete output containers in storage
+    if query_yes_no('Delete output containers?') == 'yes':
+        for run in runs:
+            print('Deleting container [{}]...'.format(run.output_container_name))
+            blob_client.delete_container(run.output_container_name)
+
+    # Delete checkpoint container in storage
+    if query_yes_no('Delete checkpoint container?') == 'yes':
+        print('Deleting container [{}]...'.format(checkpoint_container_name))
+        blob_client.delete_container(checkpoint_container_name)
 
     print()
     input('Press ENTER to exit...')
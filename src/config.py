@@ -5,6 +5,8 @@
 # Update the Batch and Storage account credential strings below with the values
 # unique to your accounts. These are used when constructing connection strings
 # for the Batch and Storage client objects.
+import os
+import sys
 from pathlib import Path
 
 
@@ -27,3 +29,68 @@ _ERROR_OUT_FILE_NAME = 'stderr.txt'  # Error Output file
 _JOB_INPUT_PATH = 'inputFiles'
 _JOB_SCRIPT_PATH = 'sourceFiles'
 _TASK_ENTRY_SCRIPT = Path(_JOB_SCRIPT_PATH, 'boston_house_price.py')
+# Times Batch retries a task that exits with a non-zero code
+_TASK_MAX_RETRY_COUNT = 2
+# Times the orchestrator reactivates a task that still failed after retries
+_TASK_REQUEUE_LIMIT = 1
+# Environment variable passing the checkpoint container SAS URL to tasks,
+# must match CHECKPOINT_URL_ENV in sourceFiles/checkpoint.py
+_CHECKPOINT_URL_ENV = 'CHECKPOINT_CONTAINER_URL'
+# Per-task result files are uploaded below this prefix in the output container
+_RESULT_BLOB_PREFIX = 'results'
+# Reduce task merging all results into one compressed summary blob
+_REDUCE_TASK_ID = 'Reduce'
+_REDUCE_SCRIPT = Path(_JOB_SCRIPT_PATH, 'reduce_outputs.py')
+_SUMMARY_BLOB_NAME = 'summary.json.gz'
+# Environment variable passing the output container SAS URL to the reduce
+# task, must match OUTPUT_URL_ENV in sourceFiles/reduce_outputs.py
+_OUTPUT_URL_ENV = 'OUTPUT_CONTAINER_URL'
+# Additionally record a sampling profile with py-spy when profiling a job,
+# profiling is enabled per experiment in _EXPERIMENTS
+_PROFILE_SAMPLING = False
+_PROFILE_BLOB_PREFIX = 'profiles'
+# Local folder for merged profile reports. Generated local files are kept
+# next to the script, like the input files are found there.
+_PROFILE_REPORT_PATH = os.path.join(sys.path[0], 'profileReports')
+_PROFILE_TOP_FUNCTIONS = 30  # Number of hotspots in the report per model
+# Experiments run as concurrent jobs on one shared pool:
+# (name, input folder, job priority from -1000 to 1000,
+#  max running tasks of the job or 0 for no limit,
+#  profile the tasks with cProfile and tracemalloc)
+_EXPERIMENTS = [
+    ('boston', _JOB_INPUT_PATH, 0, 0, False),
+]
+_TASK_COLLECTION_LIMIT = 100  # Max tasks the Batch service adds per request
+# Container of precomputed features, kept across runs to reuse them
+_FEATURE_STORE_CONTAINER = 'feature-store'
+# Environment variable passing the feature store SAS URL to tasks,
+# must match FEATURE_STORE_URL_ENV in sourceFiles/feature_store.py
+_FEATURE_STORE_URL_ENV = 'FEATURE_STORE_URL'
+# Local folder for stdout/stderr of failed jobs
+_TASK_LOG_PATH = os.path.join(sys.path[0], 'taskLogs')
+# Tasks whose stdout is printed live while they run, as
+# (experiment name, task id), e.g. ('boston', 'Task0')
+_TAIL_TASKS = []
+_POOL_SLOTS_PER_NODE = 1  # Tasks running at once on a node
+# Plan VM size, node count and slots from the run history to meet the deadline
+_PLAN_POOL = True
+_PLAN_DEADLINE_MINUTES = 30
+# The jobs are given up after the planned makespan, or the deadline without a
+# plan, times this margin
+_MONITOR_TIMEOUT_MARGIN = 1.5
+# Local runtimes of past tasks
+_RUN_HISTORY_PATH = os.path.join(sys.path[0], 'runHistory.jsonl')
+# Candidate VM sizes of the planner: (cores, memory GiB, speed relative to
+# STANDARD_A2_v2). Speeds are rough estimates, adjust them to measurements.
+_POOL_VM_SIZES = {
+    'STANDARD_A1_v2': (1, 2, 1.0),
+    'STANDARD_A2_v2': (2, 4, 1.0),
+    'STANDARD_A4_v2': (4, 8, 1.0),
+    'STANDARD_D2_v3': (2, 8, 1.6),
+    'STANDARD_F2s_v2': (2, 4, 1.9),
+}
+_POOL_MEMORY_HEADROOM = 0.8  # Share of node memory available to tasks
+# Slowdown of a task per other task sharing its node, e.g. for memory bandwidth
+_POOL_SLOT_CONTENTION = 0.15
+_NODE_STARTUP_SECONDS = 300  # Node allocation and start task
+_TASK_SETUP_SECONDS = 120  # Installing the requirements in each task
@@ -0,0 +1,160 @@
+import collections
+import heapq
+import json
+import os
+import statistics
+from typing import Dict, List, NamedTuple, Optional
+
+import config
+
+# Plans the pool from the runtimes and peak memory recorded by past runs, see
+# record_history and plan_pool.
+
+
+class PoolPlan(NamedTuple):
+    """A pool configuration with its predicted makespan."""
+    vm_size: str
+    node_count: int
+    slots_per_node: int
+    makespan_seconds: float
+    node_hours: float
+
+
+def record_history(
+        summary: dict,
+        vm_size: str,
+        slots_per_node: int,
+        history_path: str = config._RUN_HISTORY_PATH) -> None:
+    """Appends the task statistics of a job summary to the run history.
+
+    :param summary: The summary written by the reduce task.
+    :param vm_size: The VM size the tasks ran on.
+    :param slots_per_node: The tasks that shared a node.
+    :param history_path: The local run history file, one JSON record per line.
+    """
+    with open(history_path, 'a') as fd:
+        for model in summary['models']:
+            if 'runtime_seconds' not in model:
+                continue
+            fd.write(json.dumps({
+                'model': model['name'],
+                'rows': model['rows'],
+                'runtime_seconds': model['runtime_seconds'],
+                'peak_memory_bytes': model['peak_memory_bytes'],
+                'vm_size': vm_size,
+                'slots_per_node': slots_per_node,
+            }) + '\n')
+
+
+def _slowdown(slots_per_node: int) -> float:
+    """The runtime factor of a task sharing its node with other tasks."""
+    return 1 + config._POOL_SLOT_CONTENTION * (slots_per_node - 1)
+
+
+def _load_profiles(history_path: str) -> Dict[str, dict]:
+    """Summarises the run history per model.
+
+    Each model trains on one fixed dataset, so only the runs on the dataset
+    size of its most recent run are used. Runtimes are normalised to seconds
+    on a VM of speed 1.0 with one task per node.
+
+    :param history_path: The local run history file.
+    :return: Seconds and peak memory per model.
+    """
+    records = collections.defaultdict(list)
+    with open(history_path) as fd:
+        for line in fd:
+            record = json.loads(line)
+            if record['vm_size'] in config._POOL_VM_SIZES:
+                records[record['model']].append(record)
+
+    profiles = {}
+    for model, model_records in records.items():
+        rows = model_records[-1]['rows']
+        model_records = [r for r in model_records if r['rows'] == rows]
+        profiles[model] = {
+            'seconds': statistics.median(
+                r['runtime_seconds'] * config._POOL_VM_SIZES[r['vm_size']][2]
+                / _slowdown(r['slots_per_node'])
+                for r in model_records),
+            'peak_memory_bytes': max(
+                r['peak_memory_bytes'] for r in model_records),
+        }
+    return profiles
+
+
+def _makespan(runtimes: List[float], slots: int) -> float:
+    """Predicts the makespan of the tasks on the slots.
+
+    The tasks start in the given order as slots become free, like the Batch
+    service runs them in submission order.
+    """
+    finish = [0.0] * min(slots, len(runtimes))
+    for runtime in runtimes:
+        heapq.heapreplace(finish, finish[0] + runtime)
+    return max(finish, default=0.0)
+
+
+def plan_pool(
+        models: List[str],
+        max_parallel_tasks: int,
+        deadline_seconds: float,
+        history_path: str = config._RUN_HISTORY_PATH) -> Optional[PoolPlan]:
+    """Picks the pool with the fewest node-hours that meets the deadline.
+
+    Every VM size of config._POOL_VM_SIZES is tried with every node count and
+    every number of task slots per node that fits the cores and the peak
+    memory of the tasks. If no configuration meets the deadline, the fastest
+    one is returned.
+
+    :param models: The model of each task to run, in submission order.
+    :param max_parallel_tasks: The most tasks that are allowed to run at once.
+    :param deadline_seconds: The target makespan.
+    :param history_path: The local run history file.
+    :return: The plan, or None if a model has no recorded runs.
+    :raises RuntimeError: If the peak memory of the tasks does not fit any
+     candidate VM size.
+    """
+    if not os.path.exists(history_path):
+        return None
+    profiles = _load_profiles(history_path)
+    if not models or any(model not in profiles for model in models):
+        return None
+    peak_memory = max(profiles[model]['peak_memory_bytes'] for model in models)
+
+    best = None
+    for vm_size, (cores, memory_gib, speed) in config._POOL_VM_SIZES.items():
+        # Each task runs single threaded, the tasks of a node share memory
+        usable_memory = memory_gib * 2**30 * config._POOL_MEMORY_HEADROOM
+        max_slots = min(cores, int(usable_memory // peak_memory))
+        for slots in range(1, max_slots + 1):
+            runtimes = [
+                config._TASK_SETUP_SECONDS + profiles[model]['seconds']
+                * _slowdown(slots) / speed
+                for model in models]
+            max_nodes = -(-min(len(models), max_parallel_tasks) // slots)
+            for nodes in range(1, max_nodes + 1):
+                makespan = config._NODE_STARTUP_SECONDS + \
+                    _makespan(runtimes, nodes * slots)
+                plan = PoolPlan(vm_size, nodes, slots, makespan,
+                                nodes * makespan / 3600)
+                on_time = makespan <= deadline_seconds
+                if best is None:
+                    best = plan
+                    continue
+                best_on_time = best.makespan_seconds <= deadline_seconds
+                if on_time and not best_on_time:
+                    best = plan
+                elif on_time and best_on_time:
+                    if (plan.node_hours, plan.makespan_seconds) < \
+                            (best.node_hours, best.makespan_seconds):
+                        best = plan
+                elif not on_time and not best_on_time:
+                    if (plan.makespan_seconds, plan.node_hours) < \
+                            (best.makespan_seconds, best.node_hours):
+                        best = plan
+    if best is None:
+        raise RuntimeError(
+            "ERROR: Peak task memory of {:.1f} GiB does not fit any VM size "
+            "in _POOL_VM_SIZES".format(peak_memory / 2**30))
+    return best
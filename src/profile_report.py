@@ -0,0 +1,132 @@
+import collections
+import json
+import os
+import pstats
+import tempfile
+from typing import Dict, List
+
+import azure.storage.blob as azureblob
+
+import config
+
+# Aggregates the profiles uploaded by the tasks when profiling is enabled,
+# see the --profile option of sourceFiles/boston_house_price.py.
+
+
+def _folded_stacks(stats: pstats.Stats, root: str) -> Dict[str, float]:
+    """Approximates folded call stacks from the caller/callee graph.
+
+    cProfile only records caller/callee pairs, so the time of a function is
+    split between its callers in proportion to the time spent on each edge.
+
+    :param stats: The merged profile.
+    :param root: The name of the root frame, e.g. the model name.
+    :return: A mapping from ';' joined stack to self time in seconds.
+    """
+    callees = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees[caller].append((func, edge_ct))
+
+    folded = collections.Counter()
+
+    def walk(func, fraction, stack):
+        _, _, tt, ct, _ = stats.stats[func]
+        frame = pstats.func_std_string(func).replace(';', ',')
+        stack = stack + [frame]
+        folded[';'.join(stack)] += tt * fraction
+        for callee, edge_ct in callees[func]:
+            callee_ct = stats.stats[callee][3]
+            # Skip recursion and edges too small to show up in the graph
+            if callee_ct <= 0 or edge_ct * fraction < 1e-6 or \
+                    pstats.func_std_string(callee) in stack:
+                continue
+            walk(callee, fraction * edge_ct / callee_ct, stack)
+
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            walk(func, 1.0, [root])
+    return folded
+
+
+def _write_hotspots(
+        stats: pstats.Stats,
+        memory: List[dict],
+        file_path: str) -> None:
+    """Writes the ranked hotspot report of one model.
+
+    :param stats: The merged profile of all tasks of the model.
+    :param memory: The memory statistics of all tasks of the model.
+    :param file_path: The local path of the report.
+    """
+    with open(file_path, 'w') as fd:
+        fd.write(f"Tasks profiled: {len(memory)}\n")
+        fd.write("Peak traced memory: {:.1f} MiB\n".format(
+            max(m['peak_traced_bytes'] for m in memory) / 2**20))
+        fd.write("Peak RSS: {:.1f} MiB\n\n".format(
+            max(m['max_rss_bytes'] for m in memory) / 2**20))
+        stats.stream = fd
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(
+            config._PROFILE_TOP_FUNCTIONS)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+            config._PROFILE_TOP_FUNCTIONS)
+
+
+def write_profile_report(
+        blob_client: azureblob.BlockBlobService,
+        output_container_name: str,
+        report_path: str = config._PROFILE_REPORT_PATH) -> None:
+    """Merges the task profiles into a flame graph and hotspot reports.
+
+    Writes profile.folded, the folded stacks of all models for flamegraph.pl
+    or speedscope, profile.sampled.folded if sampling was enabled, and a
+    hotspot report per model.
+
+    :param blob_client: A blob service client.
+    :param output_container_name: The name for output container
+    :param report_path: The local folder for the reports.
+    """
+    print('Merging task profiles into [{}]...'.format(report_path))
+    os.makedirs(report_path, exist_ok=True)
+
+    profiles = collections.defaultdict(list)
+    memory = collections.defaultdict(list)
+    sampled = []
+    with tempfile.TemporaryDirectory() as download_path:
+        for blob in blob_client.list_blobs(
+                output_container_name, prefix=config._PROFILE_BLOB_PREFIX + '/'):
+            file_path = os.path.join(download_path,
+                                     os.path.basename(blob.name))
+            blob_client.get_blob_to_path(
+                output_container_name, blob.name, file_path)
+            if file_path.endswith('.sampled.folded'):
+                sampled.append(file_path)
+            elif file_path.endswith('.mem.json'):
+                with open(file_path) as fd:
+                    mem = json.load(fd)
+                memory[mem['label']].append(mem)
+                # The label is only known from the memory statistics
+                profiles[mem['label']].append(
+                    file_path[:-len('.mem.json')] + '.prof')
+
+        folded = collections.Counter()
+        for label, prof_paths in profiles.items():
+            stats = pstats.Stats(*prof_paths)
+            folded.update(_folded_stacks(stats, label))
+            _write_hotspots(
+                stats, memory[label],
+                os.path.join(report_path,
+                             label.replace(' ', '_') + '.hotspots.txt'))
+
+        with open(os.path.join(report_path, 'profile.folded'), 'w') as fd:
+            for stack, seconds in sorted(folded.items()):
+                # Folded stacks carry integer sample counts, use microseconds
+                if int(seconds * 1e6):
+                    fd.write(f"{stack} {int(seconds * 1e6)}\n")
+
+        if sampled:
+            with open(os.path.join(report_path, 'profile.sampled.folded'),
+                      'w') as out:
+                for file_path in sampled:
+                    with open(file_path) as fd:
+                        out.write(fd.read())
@@ -0,0 +1,48 @@
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+
+# Minimal Blob storage REST client working on container SAS URLs, so tasks
+# can reach storage with the standard library only.
+
+
+def blob_url(container_url, blob_name):
+    base, _, sas_token = container_url.partition('?')
+    return f"{base}/{urllib.parse.quote(blob_name)}?{sas_token}"
+
+
+def put_blob(container_url, blob_name, data):
+    request = urllib.request.Request(
+        blob_url(container_url, blob_name), data=data, method='PUT',
+        headers={'x-ms-blob-type': 'BlockBlob'})
+    with urllib.request.urlopen(request):
+        pass
+
+
+def get_blob(container_url, blob_name):
+    """Return the blob content, or None if the blob does not exist."""
+    try:
+        with urllib.request.urlopen(blob_url(container_url, blob_name)) as response:
+            return response.read()
+    except urllib.error.HTTPError as err:
+        if err.code == 404:
+            return None
+        raise
+
+
+def list_blobs(container_url, prefix=''):
+    """Yield the names of all blobs in the container starting with prefix."""
+    base, _, sas_token = container_url.partition('?')
+    marker = ''
+    while True:
+        query = urllib.parse.urlencode(
+            {'restype': 'container', 'comp': 'list',
+             'prefix': prefix, 'marker': marker})
+        with urllib.request.urlopen(f"{base}?{query}&{sas_token}") as response:
+            root = ET.fromstring(response.read())
+        for name in root.iter('Name'):
+            yield name.text
+        marker = root.findtext('NextMarker')
+        if not marker:
+            return
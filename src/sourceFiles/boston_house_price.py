@@ -1,5 +1,7 @@
 # Importing the libraries
 import argparse
+import resource
+import time
 import pandas as pd
 import numpy as np
 from sklearn import metrics
@@ -8,6 +10,8 @@ import random_forest
 import linear_regression
 import mlp
 import svm
+import profiling
+import feature_store
 
 # Importing the Boston Housing dataset
 from sklearn.datasets import load_boston
@@ -19,6 +23,8 @@ def parse_args():
                         help='Config file for select a method.')
     parser.add_argument('output', type=str,
                         help='Output filename')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Profile the run and write stats to PROFILE.*')
     return parser.parse_args()
 
 
@@ -49,6 +55,12 @@ def get_X_y():
     return X_train, X_test, y_train, y_test
 
 
+def evaluate(method, pipeline=()):
+    X_train, X_test, y_train, y_test = get_X_y()
+    X_train, X_test = feature_store.load_features(pipeline, X_train, X_test)
+    return method(X_train, X_test, y_train, y_test), len(X_train) + len(X_test)
+
+
 if __name__ == '__main__':
     args = parse_args()
     with open(args.config) as f:
@@ -59,10 +71,27 @@ if __name__ == '__main__':
         "multi-layer perceptron": mlp.train_evaluation_model,
         "svm": svm.train_evaluation_model
     }
-    X_train, X_test, y_train, y_test = get_X_y()
-    acc = methods.get(first_line, default_method)(
-        X_train, X_test, y_train, y_test)
+    # Preprocessing of the models, computed once and shared through the
+    # feature store
+    pipelines = {
+        "svm": svm.PIPELINE
+    }
+    method = methods.get(first_line, default_method)
+    pipeline = pipelines.get(first_line, ())
+    start = time.perf_counter()
+    if args.profile:
+        acc, rows = profiling.profile_call(args.profile, first_line, evaluate,
+                                           method, pipeline)
+    else:
+        acc, rows = evaluate(method, pipeline)
+    runtime = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
     print(f"The accuracy is {acc}")
     with open(args.output, "w") as fd:
         fd.write(f'{first_line}\n')
-        fd.write(f'R-squared Score: {acc}')
+        fd.write(f'R-squared Score: {acc}\n')
+        # Recorded by the orchestrator to plan the pool of later runs
+        fd.write(f'Runtime seconds: {runtime}\n')
+        fd.write(f'Peak memory bytes: {peak_memory}\n')
+        fd.write(f'Rows: {rows}')
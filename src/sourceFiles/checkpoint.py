@@ -0,0 +1,51 @@
+import os
+import pickle
+import urllib.error
+import blob_rest
+
+# Environment variable holding a read/write SAS URL of the checkpoint
+# container. It is set by the orchestrator on every task, see
+# config._CHECKPOINT_URL_ENV.
+CHECKPOINT_URL_ENV = 'CHECKPOINT_CONTAINER_URL'
+
+
+def _blob_name(name):
+    job_id = os.environ.get('AZ_BATCH_JOB_ID', 'local')
+    task_id = os.environ.get('AZ_BATCH_TASK_ID', 'local')
+    return f"{job_id}/{task_id}/{name}"
+
+
+def save_checkpoint(name, obj):
+    """Pickle obj and upload it to the checkpoint container.
+
+    The blob is keyed by job and task id, so a task that is requeued after
+    preemption or a retry finds the checkpoint of its previous attempt.
+    Does nothing when no checkpoint container is configured.
+    """
+    container_url = os.environ.get(CHECKPOINT_URL_ENV)
+    if not container_url:
+        return False
+    try:
+        blob_rest.put_blob(container_url, _blob_name(name), pickle.dumps(obj))
+    except urllib.error.URLError as err:
+        # A lost checkpoint only costs recomputation, never fail the task.
+        print(f"Could not save checkpoint {name}: {err}")
+        return False
+    return True
+
+
+def load_checkpoint(name):
+    """Download and unpickle the checkpoint saved under name.
+
+    Returns None if no checkpoint container is configured or no checkpoint
+    has been saved yet.
+    """
+    container_url = os.environ.get(CHECKPOINT_URL_ENV)
+    if not container_url:
+        return None
+    try:
+        data = blob_rest.get_blob(container_url, _blob_name(name))
+    except urllib.error.URLError as err:
+        print(f"Could not load checkpoint {name}: {err}")
+        return None
+    return None if data is None else pickle.loads(data)
@@ -0,0 +1,128 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import urllib.error
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import MinMaxScaler, PolynomialFeatures, StandardScaler
+import blob_rest
+
+# Environment variable holding a read/write SAS URL of the feature store
+# container, see config._FEATURE_STORE_URL_ENV.
+FEATURE_STORE_URL_ENV = 'FEATURE_STORE_URL'
+
+# Transforms a pipeline can be declared with, as (name, parameters) steps
+TRANSFORMS = {
+    'standard_scaler': StandardScaler,
+    'min_max_scaler': MinMaxScaler,
+    'polynomial_features': PolynomialFeatures,
+    'pca': PCA,
+}
+
+SPLITS = ('train', 'test')
+
+
+def dataset_version(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode('utf-8'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def pipeline_hash(pipeline):
+    spec = json.dumps([[name, params] for name, params in pipeline],
+                      sort_keys=True)
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()[:16]
+
+
+def transform(pipeline, X_train, X_test):
+    for name, params in pipeline:
+        step = TRANSFORMS[name](**params)
+        X_train = step.fit_transform(X_train)
+        X_test = step.transform(X_test)
+    return X_train, X_test
+
+
+def _local_dir():
+    # The node shared directory is kept across tasks and jobs on a node
+    root = os.environ.get('AZ_BATCH_NODE_SHARED_DIR', tempfile.gettempdir())
+    path = os.path.join(root, 'feature_store')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _save_atomic(path, data):
+    # Other tasks on the node may read the same entry concurrently
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _to_npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype=np.float32))
+    return buffer.getvalue()
+
+
+def _fetch(key, paths):
+    container_url = os.environ.get(FEATURE_STORE_URL_ENV)
+    if not container_url:
+        return False
+    try:
+        blobs = {split: blob_rest.get_blob(container_url, f"{key}/{split}.npy")
+                 for split in SPLITS}
+    except urllib.error.URLError as err:
+        print(f"Could not read feature store: {err}")
+        return False
+    if any(data is None for data in blobs.values()):
+        return False
+    for split, data in blobs.items():
+        _save_atomic(paths[split], data)
+    return True
+
+
+def _publish(key, npys):
+    container_url = os.environ.get(FEATURE_STORE_URL_ENV)
+    if not container_url:
+        return
+    try:
+        for split, data in npys.items():
+            blob_rest.put_blob(container_url, f"{key}/{split}.npy", data)
+    except urllib.error.URLError as err:
+        # Other tasks then compute the features themselves
+        print(f"Could not write feature store: {err}")
+
+
+def load_features(pipeline, X_train, X_test):
+    """Return X_train and X_test transformed by the declared pipeline.
+
+    The transformed arrays are computed once per dataset version and pipeline
+    hash, stored as float32 .npy files on the node and in the feature store
+    container, and returned as read-only memory maps. An empty pipeline
+    returns the inputs unchanged.
+    """
+    if not pipeline:
+        return X_train, X_test
+    key = f"{dataset_version(X_train, X_test)}-{pipeline_hash(pipeline)}"
+    store = _local_dir()
+    paths = {split: os.path.join(store, f"{key}.{split}.npy")
+             for split in SPLITS}
+
+    if all(os.path.exists(path) for path in paths.values()):
+        print(f"Features {key} found on node")
+    elif _fetch(key, paths):
+        print(f"Features {key} loaded from feature store")
+    else:
+        print(f"Computing features {key}")
+        arrays = dict(zip(SPLITS, transform(pipeline, X_train, X_test)))
+        npys = {split: _to_npy(array) for split, array in arrays.items()}
+        for split, data in npys.items():
+            _save_atomic(paths[split], data)
+        _publish(key, npys)
+
+    return tuple(np.load(paths[split], mmap_mode='r') for split in SPLITS)
@@ -1,12 +1,59 @@
+import warnings
 import numpy as np
 from sklearn import metrics
+from sklearn.exceptions import ConvergenceWarning
 # Import MLP Regressor
 from sklearn.neural_network import MLPRegressor
+import checkpoint
+
+MAX_ITER = 500
+# Number of training epochs between two checkpoints
+CHECKPOINT_INTERVAL = 50
+CHECKPOINT_NAME = 'mlp.pkl'
+
+
+def _converged(reg):
+    # Same stopping rule as fit: the training loss did not improve by more
+    # than tol for more than n_iter_no_change consecutive epochs
+    best_loss = np.inf
+    no_improvement = 0
+    for loss in getattr(reg, 'loss_curve_', []):
+        if loss > best_loss - reg.tol:
+            no_improvement += 1
+        else:
+            no_improvement = 0
+        best_loss = min(best_loss, loss)
+    return no_improvement > reg.n_iter_no_change
+
+
+def fit_with_checkpoint(X_train, y_train):
+    # Resume from the last checkpoint if this task was preempted or retried
+    reg = checkpoint.load_checkpoint(CHECKPOINT_NAME)
+    if reg is None:
+        # partial_fit re-seeds from random_state on every call, pass a
+        # RandomState so the epochs are shuffled as by one fit call and the
+        # checkpoint carries the shuffle state
+        reg = MLPRegressor(random_state=np.random.RandomState(1),
+                           max_iter=MAX_ITER)
+    else:
+        print(f"Resuming from checkpoint at iteration {reg.n_iter_}")
+
+    # One epoch per partial_fit call, which keeps the optimizer state
+    while getattr(reg, 'n_iter_', 0) < MAX_ITER and not _converged(reg):
+        reg.partial_fit(X_train, y_train)
+        if reg.n_iter_ % CHECKPOINT_INTERVAL == 0 or _converged(reg):
+            checkpoint.save_checkpoint(CHECKPOINT_NAME, reg)
+
+    if not _converged(reg):
+        warnings.warn(
+            f"Stochastic Optimizer: Maximum iterations ({MAX_ITER}) reached "
+            "and the optimization hasn't converged yet.", ConvergenceWarning)
+    return reg
 
 
 def train_evaluation_model(X_train, X_test, y_train, y_test):
     # Train the model using the training sets
-    reg = MLPRegressor(random_state=1, max_iter=500).fit(X_train, y_train)
+    reg = fit_with_checkpoint(X_train, y_train)
 
     # Model prediction on train data
     y_pred = reg.predict(X_train)
@@ -0,0 +1,38 @@
+import cProfile
+import json
+import resource
+import tracemalloc
+
+# Number of allocation sites reported in the memory statistics
+TOP_ALLOCATIONS = 10
+
+
+def profile_call(prefix, label, func, *args):
+    """Run func under cProfile and tracemalloc and return its result.
+
+    Writes the cProfile stats to {prefix}.prof and the peak memory with the
+    top allocation sites to {prefix}.mem.json, labelled for aggregation.
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profiler.dump_stats(f'{prefix}.prof')
+        memory = {
+            'label': label,
+            'peak_traced_bytes': peak,
+            # ru_maxrss is in kilobytes on Linux
+            'max_rss_bytes': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'top_allocations': [
+                {'where': str(stat.traceback), 'size': stat.size,
+                 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+        }
+        with open(f'{prefix}.mem.json', 'w') as fd:
+            json.dump(memory, fd, indent=2)
@@ -0,0 +1,55 @@
+import argparse
+import gzip
+import json
+import os
+import blob_rest
+
+# Environment variable holding a read/list/write SAS URL of the output
+# container, see config._OUTPUT_URL_ENV.
+OUTPUT_URL_ENV = 'OUTPUT_CONTAINER_URL'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Merge the results of all tasks into one summary blob.')
+    parser.add_argument('prefix', type=str,
+                        help='Blob prefix of the per-task result files')
+    parser.add_argument('summary', type=str,
+                        help='Blob name of the compressed summary')
+    return parser.parse_args()
+
+
+def parse_result(content):
+    name, score, *stats = content.splitlines()
+    result = {'name': name, 'score': float(score.split(": ")[1])}
+    # Task statistics like "Runtime seconds: 12.3" become runtime_seconds
+    for line in stats:
+        key, _, value = line.partition(": ")
+        result[key.lower().replace(' ', '_')] = float(value)
+    return result
+
+
+def reduce_outputs(container_url, prefix):
+    models = []
+    for blob_name in blob_rest.list_blobs(container_url, prefix):
+        content = blob_rest.get_blob(container_url, blob_name)
+        if content is None:
+            continue
+        try:
+            result = parse_result(content.decode('utf-8'))
+        except (ValueError, IndexError):
+            print(f"Skipping malformed result {blob_name}")
+            continue
+        result['blob'] = blob_name
+        models.append(result)
+    models.sort(key=lambda m: m['score'], reverse=True)
+    return {'job_id': os.environ.get('AZ_BATCH_JOB_ID'), 'models': models}
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    container_url = os.environ[OUTPUT_URL_ENV]
+    summary = reduce_outputs(container_url, args.prefix)
+    print(f"Merged {len(summary['models'])} results")
+    blob_rest.put_blob(container_url, args.summary,
+                       gzip.compress(json.dumps(summary).encode('utf-8')))
@@ -1,14 +1,12 @@
 import numpy as np
 from sklearn import metrics
-from sklearn.preprocessing import StandardScaler
 from sklearn import svm
 
+# Preprocessing applied through the feature store before training
+PIPELINE = (('standard_scaler', {}),)
 
-def train_evaluation_model(X_train, X_test, y_train, y_test):
-    sc = StandardScaler()
-    X_train = sc.fit_transform(X_train)
-    X_test = sc.transform(X_test)
 
+def train_evaluation_model(X_train, X_test, y_train, y_test):
     # Create a SVM Regressor
     reg = svm.SVR()
 